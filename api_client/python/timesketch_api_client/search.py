@@ -15,6 +15,7 @@
 import datetime
 import json
 import logging
+import re
 
 import pandas
 
@@ -25,6 +26,113 @@ from . import searchtemplate
 
 logger = logging.getLogger('timesketch_api.search')
 
+# The value of a date interval chip, eg: 2020-11-30T12:12:12 -5m +5m
+_INTERVAL_SUFFIX_RE = re.compile(
+    r'^(.+?)\s+-(\d+)([smhd])\s+\+(\d+)[smhd]\s*$', re.ASCII)
+
+
+def _parse_iso(date_string):
+    """Splits an ISO 8601 date string into its components.
+
+    Only the subset of ISO 8601 used by the date chips is supported, that is
+    YYYY-MM-DD optionally followed by a time, HH:MM:SS, separated by either
+    a "T" or a space, an optional fraction of one to six digits and a
+    trailing "Z".
+
+    Args:
+        date_string (str): the date string, eg: 2020-11-30T12:12:12.
+
+    Raises:
+        ValueError: if the date string is incorrectly formatted.
+
+    Returns:
+        A tuple with the year, month, day, hour, minute and second as
+        integers and a boolean that indicates whether the date string
+        contains a non-zero fraction of a second. The time values are None
+        if the date string does not include a time.
+    """
+    if len(date_string) > 19 and date_string[-1] == 'Z':
+        date_string = date_string[:-1]
+
+    length = len(date_string)
+    if length not in (10, 19) and not 21 <= length <= 26:
+        raise ValueError('Wrong date format')
+    if not date_string.isascii():
+        raise ValueError('Wrong date format')
+
+    if date_string[4] != '-' or date_string[7] != '-':
+        raise ValueError('Wrong date format')
+
+    digits = [date_string[0:4], date_string[5:7], date_string[8:10]]
+    if length > 10:
+        if date_string[10] not in ('T', ' '):
+            raise ValueError('Wrong date format')
+        if date_string[13] != ':' or date_string[16] != ':':
+            raise ValueError('Wrong date format')
+        digits.extend(
+            [date_string[11:13], date_string[14:16], date_string[17:19]])
+
+    fraction = False
+    if length > 19:
+        if date_string[19] != '.' or not date_string[20:].isdigit():
+            raise ValueError('Wrong date format')
+        fraction = bool(date_string[20:].strip('0'))
+
+    if not all(value.isdigit() for value in digits):
+        raise ValueError('Wrong date format')
+
+    year, month, day = (int(value) for value in digits[:3])
+    if not 1 <= month <= 12 or not 1 <= day <= 31:
+        raise ValueError('Wrong date format')
+
+    if length == 10:
+        return year, month, day, None, None, None, fraction
+
+    hour, minute, second = (int(value) for value in digits[3:])
+    if hour > 23 or minute > 59 or second > 59:
+        raise ValueError('Wrong date format')
+
+    return year, month, day, hour, minute, second, fraction
+
+
+def _parse_date(date_string, require_time=False):
+    """Returns a datetime object from a chip date string.
+
+    Args:
+        date_string (str): the date string, eg: 2020-11-30T12:12:12.
+        require_time (bool): if set to True the date string needs to
+            include a time component. Defaults to False.
+
+    Raises:
+        ValueError: if the date string is incorrectly formatted.
+
+    Returns:
+        A datetime object (datetime.datetime).
+    """
+    try:
+        year, month, day, hour, minute, second, fraction = _parse_iso(
+            date_string)
+    except ValueError:
+        logger.error(
+            'Unable to add date chip, wrong date format: %s', date_string)
+        raise
+
+    if require_time and hour is None:
+        logger.error(
+            'Unable to add date chip, missing time: %s', date_string)
+        raise ValueError('Wrong date format')
+
+    if fraction:
+        raise ValueError('Microsecond dates are not currently supported')
+
+    try:
+        return datetime.datetime(
+            year, month, day, hour or 0, minute or 0, second or 0)
+    except ValueError as exc:
+        logger.error(
+            'Unable to add date chip, wrong date format', exc_info=True)
+        raise ValueError('Wrong date format') from exc
+
 
 class Chip:
     """Class definition for a query filter chip."""
@@ -98,8 +206,6 @@ class DateIntervalChip(Chip):
     CHIP_VALUE = 'interval'
 
     _DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
-    _DATE_FORMAT_MICROSECONDS = '%Y-%m-%dT%H:%M:%S.%f'
-    _DATE_ONLY_FORMAT = '%Y-%m-%d'
 
     def __init__(self):
         """Initialize the chip."""
@@ -162,24 +268,7 @@ class DateIntervalChip(Chip):
     @date.setter
     def date(self, date):
         """Make changes to the date."""
-        try:
-            dt = datetime.datetime.strptime(date,
-                                            self._DATE_FORMAT_MICROSECONDS)
-        except ValueError:
-            try:
-                dt = datetime.datetime.strptime(date, self._DATE_FORMAT)
-            except ValueError:
-                try:
-                    dt = datetime.datetime.strptime(date,
-                                                    self._DATE_ONLY_FORMAT)
-                except ValueError as exc:
-                    logger.error(
-                        'Unable to add date chip, wrong date format',
-                        exc_info=True)
-                    raise ValueError('Wrong date format') from exc
-        if dt.microsecond > 0:
-            raise ValueError('Microsecond dates are not currently supported')
-        self._date = dt
+        self._date = _parse_date(date)
 
     def from_dict(self, chip_dict):
         """Configure the chip from a dictionary."""
@@ -187,23 +276,19 @@ class DateIntervalChip(Chip):
         if not value:
             return
 
-        split_value = value.split()
-        if len(split_value) == 3:
-            date_time, before, after = split_value
-        elif len(split_value) == 4:
-            date, time, before, after = split_value
-            date_time = f'{date}T{time}'
-        else:
+        match = _INTERVAL_SUFFIX_RE.match(value)
+        if not match:
             raise ValueError(
                 'Unable to configure date chip, wrong date format.')
 
-        self.unit = before[-1]
+        date_time, before, unit, after = match.groups()
+        self.unit = unit
         if date_time.endswith('Z'):
             self.date = date_time[:-1]
         else:
             self.date = date_time
-        self.before = int(before[1:-1])
-        self.after = int(after[1:-1])
+        self.before = int(before)
+        self.after = int(after)
 
     @property
     def interval(self):
@@ -233,7 +318,6 @@ class DateRangeChip(Chip):
     CHIP_VALUE = 'date_range'
 
     _DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
-    _DATE_FORMAT_MICROSECONDS = '%Y-%m-%dT%H:%M:%S.%f'
 
     def __init__(self):
         """Initialize the date range."""
@@ -252,20 +336,7 @@ class DateRangeChip(Chip):
         """
         if end_time.endswith('Z'):
             end_time = end_time[:-1]
-        try:
-            dt = datetime.datetime.strptime(end_time,
-                                            self._DATE_FORMAT_MICROSECONDS)
-        except ValueError as exc:
-            try:
-                dt = datetime.datetime.strptime(end_time, self._DATE_FORMAT)
-            except ValueError as exc:
-                logger.error(
-                    'Unable to add date chip, wrong date format',
-                    exc_info=True)
-                raise ValueError('Wrong date format') from exc
-        if dt.microsecond > 0:
-            raise ValueError('Microsecond dates are not currently supported')
-        self._end_date = dt
+        self._end_date = _parse_date(end_time, require_time=True)
 
     def add_start_time(self, start_time):
         """Add a start time to the range.
@@ -278,20 +349,7 @@ class DateRangeChip(Chip):
         """
         if start_time.endswith('Z'):
             start_time = start_time[:-1]
-        try:
-            dt = datetime.datetime.strptime(start_time,
-                                            self._DATE_FORMAT_MICROSECONDS)
-        except ValueError as exc:
-            try:
-                dt = datetime.datetime.strptime(start_time, self._DATE_FORMAT)
-            except ValueError as exc:
-                logger.error(
-                    'Unable to add date chip, wrong date format',
-                    exc_info=True)
-                raise ValueError('Wrong date format') from exc
-        if dt.microsecond > 0:
-            raise ValueError('Microsecond dates are not currently supported')
-        self._start_date = dt
+        self._start_date = _parse_date(start_time, require_time=True)
 
     @property
     def end_time(self):
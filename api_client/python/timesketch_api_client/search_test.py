@@ -186,6 +186,34 @@ class SearchTest(unittest.TestCase):
             date_string = '2020-12-12T12:12:12.001,2020-12-12T12:12:12.001'
             chip.from_dict({'value': date_string})
 
+    def test_parse_iso(self):
+        """Test parsing ISO 8601 date strings used by the date chips."""
+        # pylint: disable=protected-access
+        self.assertEqual(
+            search._parse_iso('2020-12-12'),
+            (2020, 12, 12, None, None, None, False))
+        self.assertEqual(
+            search._parse_iso('2020-12-12 01:02:03.000Z'),
+            (2020, 12, 12, 1, 2, 3, False))
+        self.assertEqual(
+            search._parse_iso('2020-12-12T01:02:03.001'),
+            (2020, 12, 12, 1, 2, 3, True))
+        self.assertEqual(
+            search._parse_iso('2020-12-12T01:02:03.000000'),
+            (2020, 12, 12, 1, 2, 3, False))
+        self.assertEqual(
+            search._parse_iso('2020-12-12T01:02:03.0Z'),
+            (2020, 12, 12, 1, 2, 3, False))
+        self.assertEqual(
+            search._parse_iso('2020-12-12T01:02:03.123456'),
+            (2020, 12, 12, 1, 2, 3, True))
+
+        for date_string in (
+                '2020-12-1', '2020/12/12', '2020-13-12', '2020-12-12T25:00:00',
+                '2020-12-12T01:02:03X', '2020-12-12T01:02:03.',
+                '2020-12-12T01:02:03.0000000', '2020-12-12Z'):
+            with self.assertRaises(ValueError):
+                search._parse_iso(date_string)
 
     def test_from_date_interval(self):
         """Test from_date method in DateIntervalChip."""
@@ -24,6 +24,7 @@ from sqlalchemy import Table
 from sqlalchemy import BigInteger
 from sqlalchemy import Column
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import Unicode
 from sqlalchemy import UnicodeText
@@ -245,6 +246,12 @@ class SearchIndex(AccessControlMixin, LabelMixin, StatusMixin, CommentMixin,
         'Timeline', backref='searchindex', lazy='dynamic')
     events = relationship('Event', backref='searchindex', lazy='dynamic')
 
+    __table_args__ = (
+        # The id is included so the lookup by name and index name can be
+        # answered from the index alone on PostgreSQL as well.
+        Index('ix_searchindex_name_index_name', 'name', 'index_name', 'id'),
+    )
+
     def __init__(self, name, description, index_name, user):
         """Initialize the SearchIndex object.
 
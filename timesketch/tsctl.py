@@ -15,12 +15,9 @@
 """This module is for management of the Timesketch application."""
 from __future__ import unicode_literals
 
-import codecs
 import sys
 import yaml
 
-import six
-
 from flask import current_app
 
 from flask_migrate import MigrateCommand
@@ -30,7 +27,19 @@ from flask_script import Server
 from flask_script import Option
 from flask_script import prompt_bool
 from flask_script import prompt_pass
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import load_only
+
+# Use the libyaml based loader and dumper if available, they are
+# considerably faster than the pure Python implementations.
+try:
+    from yaml import CSafeDumper as YamlDumper
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+    from yaml import SafeLoader as YamlLoader
 
 from timesketch import version
 from timesketch.app import create_app
@@ -77,18 +86,18 @@ class GrantUser(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self, username, sketch_id):
         """Creates the user."""
-        if not isinstance(sketch_id, six.text_type):
-            sketch_id = codecs.decode(sketch_id, 'utf-8')
-        if not isinstance(username, six.text_type):
-            username = codecs.decode(username, 'utf-8')
-        sketch = Sketch.query.filter_by(id=sketch_id).first()
-        user = User.query.filter_by(username=username).first()
-        if not sketch:
-            sys.stdout.write('No sketch found with this ID.')
-        elif not user:
-            sys.stdout.write('User [{0:s}] does not exist.\n'.format(
-                username))
+        row = db_session.query(Sketch, User).filter(
+            Sketch.id == sketch_id, User.username == username).one_or_none()
+        if not row:
+            # Only look up what is missing when the combined query fails.
+            if not db_session.query(Sketch.id).filter(
+                    Sketch.id == sketch_id).first():
+                sys.stdout.write('No sketch found with this ID.')
+            else:
+                sys.stdout.write('User [{0:s}] does not exist.\n'.format(
+                    username))
         else:
+            sketch, user = row
             sketch.grant_permission(permission='read', user=user)
             sketch.grant_permission(permission='write', user=user)
             sys.stdout.write('User {0:s} added to the sketch {1:s}.\n'.format(
@@ -103,22 +112,18 @@ class AddUser(Command):
 
     def get_password_from_prompt(self):
         """Get password from the command line prompt."""
-        first_password = prompt_pass('Enter password')
-        second_password = prompt_pass('Enter password again')
-        if first_password != second_password:
+        while True:
+            first_password = prompt_pass('Enter password')
+            second_password = prompt_pass('Enter password again')
+            if first_password == second_password:
+                return first_password
             sys.stderr.write('Passwords don\'t match, try again.\n')
-            self.get_password_from_prompt()
-        return first_password
 
     # pylint: disable=arguments-differ, method-hidden
     def run(self, username, password):
         """Creates the user."""
         if not password:
             password = self.get_password_from_prompt()
-        if not isinstance(password, six.text_type):
-            password = codecs.decode(password, 'utf-8')
-        if not isinstance(username, six.text_type):
-            username = codecs.decode(username, 'utf-8')
         user = User.get_or_create(username=username)
         user.set_password(plaintext=password)
         db_session.add(user)
@@ -138,15 +143,14 @@ class MakeUserAdmin(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self, username, remove):
         """Adds the admin bit to a user."""
-        user = User.query.filter_by(username=username).first()
+        updated = User.query.filter_by(username=username).update(
+            {'admin': not remove}, synchronize_session=False)
+        db_session.commit()
 
-        if not user:
+        if not updated:
             sys.stdout.write('User [{0:s}] does not exist.\n'.format(
                 username))
             return
-        user.admin = not remove
-        db_session.add(user)
-        db_session.commit()
 
         if remove:
             sys.stdout.write('User {0:s} is no longer an admin.\n'.format(
@@ -163,15 +167,14 @@ class DisableUser(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self, username):
         """Sets the active bit of a user to false."""
-        user = User.query.filter_by(username=username).first()
+        updated = User.query.filter_by(username=username).update(
+            {'active': False}, synchronize_session=False)
+        db_session.commit()
 
-        if not user:
+        if not updated:
             sys.stdout.write('User [{0:s}] does not exist.\n'.format(
                 username))
             return
-        user.active = False
-        db_session.add(user)
-        db_session.commit()
 
         sys.stdout.write('User {0:s} is deactivated.\n'.format(username))
 
@@ -184,15 +187,14 @@ class EnableUser(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self, username):
         """Sets the active bit of a user to true."""
-        user = User.query.filter_by(username=username).first()
+        updated = User.query.filter_by(username=username).update(
+            {'active': True}, synchronize_session=False)
+        db_session.commit()
 
-        if not user:
+        if not updated:
             sys.stdout.write('User [{0:s}] does not exist.\n'.format(
                 username))
             return
-        user.active = True
-        db_session.add(user)
-        db_session.commit()
 
         sys.stdout.write('User {0:s} is activated.\n'.format(username))
 
@@ -202,12 +204,14 @@ class ListUsers(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self):
         """The run method for the command."""
-        for user in User.query.all():
-            if user.admin:
+        users = db_session.query(User.username, User.admin).yield_per(500)
+        for username, admin in users:
+            if admin:
                 extra = ' (admin)'
             else:
                 extra = ''
-            print('{0:s}{1:s}'.format(user.username, extra))
+            sys.stdout.write('{0:s}{1:s}\n'.format(username, extra))
+        sys.stdout.flush()
 
 
 class AddGroup(Command):
@@ -217,8 +221,6 @@ class AddGroup(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self, name):
         """Creates the group."""
-        if not isinstance(name, six.text_type):
-            name = codecs.decode(name, 'utf-8')
         group = Group.get_or_create(name=name)
         db_session.add(group)
         db_session.commit()
@@ -231,8 +233,9 @@ class ListGroups(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self):
         """The run method for the command."""
-        for group in Group.query.all():
-            print(group.name)
+        for (group_name,) in db_session.query(Group.name).yield_per(500):
+            sys.stdout.write('{0:s}\n'.format(group_name))
+        sys.stdout.flush()
 
 
 class GroupManager(Command):
@@ -258,9 +261,6 @@ class GroupManager(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self, remove, expand, group_name, user_name):
         """Add the user to the group."""
-        if not isinstance(group_name, six.text_type):
-            group_name = codecs.decode(group_name, 'utf-8')
-
         group = Group.query.filter_by(name=group_name).first()
 
         # List all members of a group and then exit.
@@ -269,11 +269,10 @@ class GroupManager(Command):
                 print(_user.username)
             return
 
-        if not isinstance(user_name, six.text_type):
-            user_name = codecs.decode(user_name, 'utf-8')
         user = None
         if user_name:
-            user = User.query.filter_by(username=user_name).first()
+            user = User.query.options(load_only(User.id)).filter_by(
+                username=user_name).first()
 
         # Add or remove user from group
         if remove and user:
@@ -316,7 +315,8 @@ class AddSearchIndex(Command):
         if not datastore.client.indices.exists(index=index):
             sys.stderr.write('Index does not exist in the datastore\n')
             sys.exit(1)
-        if SearchIndex.query.filter_by(name=name, index_name=index).first():
+        if db_session.query(SearchIndex.id).filter_by(
+                name=name, index_name=index).first():
             sys.stderr.write(
                 'Index with this name already exist in Timesketch\n')
             sys.exit(1)
@@ -340,9 +340,6 @@ class PurgeTimeline(Command):
         Args:
             index_name: The name of the index in OpenSearch
         """
-        if not isinstance(index_name, six.text_type):
-            index_name = codecs.decode(index_name, 'utf-8')
-
         searchindex = SearchIndex.query.filter_by(
             index_name=index_name).first()
 
@@ -354,7 +351,10 @@ class PurgeTimeline(Command):
             host=current_app.config['OPENSEARCH_HOST'],
             port=current_app.config['OPENSEARCH_PORT'])
 
-        timelines = Timeline.query.filter_by(searchindex=searchindex).all()
+        # The sketch and its status are loaded in the same query, otherwise
+        # every timeline would issue two extra queries below.
+        timelines = Timeline.query.filter_by(searchindex=searchindex).options(
+            joinedload(Timeline.sketch).joinedload(Sketch.status)).all()
         sketches = [
             t.sketch for t in timelines
             if t.sketch and t.sketch.get_status.status != 'deleted'
@@ -406,45 +406,62 @@ class SearchTemplateManager(Command):
                 })
 
             with open(export_location, 'w') as fh:
-                yaml.safe_dump(search_templates, stream=fh)
+                yaml.dump(search_templates, stream=fh, Dumper=YamlDumper)
 
         if import_location:
             try:
                 with open(import_location, 'rb') as fh:
-                    search_templates = yaml.safe_load(fh)
+                    search_templates = yaml.load(fh, Loader=YamlLoader)
             except IOError as e:
                 sys.stdout.write('Unable to open file: {0!s}\n'.format(e))
                 sys.exit(1)
 
-            for search_template in search_templates:
-                name = search_template['name']
-                query_string = search_template['query_string']
-                query_dsl = search_template['query_dsl']
+            # Skip search templates that already exist.
+            template_names = [
+                search_template['name'] for search_template in search_templates]
+            existing_names = set(
+                row[0] for row in db_session.query(SearchTemplate.name).filter(
+                    SearchTemplate.name.in_(template_names)))
 
-                # Skip search template if already exits.
-                if SearchTemplate.query.filter_by(name=name).first():
+            new_templates = []
+            for search_template in search_templates:
+                if search_template['name'] in existing_names:
                     continue
+                existing_names.add(search_template['name'])
+                new_templates.append(search_template)
 
+            # Fetch all labels used by the templates in a single query.
+            label_names = set(['remote_template'])
+            for search_template in new_templates:
+                for supported_os in search_template['supported_os']:
+                    label_names.add('supported_os:{0:s}'.format(supported_os))
+            label_query = SearchTemplate.Label.query.filter(
+                SearchTemplate.Label.label.in_(label_names),
+                SearchTemplate.Label.user_id.is_(None))
+            labels = {label.label: label for label in label_query}
+            for label_name in label_names - set(labels):
+                labels[label_name] = SearchTemplate.Label(
+                    label=label_name, user=None)
+
+            imported_templates = []
+            for search_template in new_templates:
                 imported_template = SearchTemplate(
-                    name=name,
+                    name=search_template['name'],
                     user=User(None),
-                    query_string=query_string,
-                    query_dsl=query_dsl)
+                    query_string=search_template['query_string'],
+                    query_dsl=search_template['query_dsl'])
 
                 # Add supported_os labels.
                 for supported_os in search_template['supported_os']:
                     label_name = 'supported_os:{0:s}'.format(supported_os)
-                    label = SearchTemplate.Label.get_or_create(
-                        label=label_name, user=None)
-                    imported_template.labels.append(label)
+                    imported_template.labels.append(labels[label_name])
 
                 # Set flag to identify local vs import templates.
-                remote_flag = SearchTemplate.Label.get_or_create(
-                    label='remote_template', user=None)
-                imported_template.labels.append(remote_flag)
+                imported_template.labels.append(labels['remote_template'])
+                imported_templates.append(imported_template)
 
-                db_session.add(imported_template)
-                db_session.commit()
+            db_session.add_all(imported_templates)
+            db_session.commit()
 
 
 class ListSketches(Command):
@@ -453,10 +470,18 @@ class ListSketches(Command):
     # pylint: disable=arguments-differ, method-hidden
     def run(self):
         """The run method for the command."""
-        sketches = Sketch.query.all()
-
-        name_len = max([len(x.name) for x in sketches])
-        desc_len = max([len(x.description) for x in sketches])
+        # Only fetch the columns needed for the listing, including the
+        # sketch status, and stream the rows instead of loading them all.
+        sketch_status = Sketch.Status
+        sketches = db_session.query(
+            Sketch.id, Sketch.name, Sketch.description,
+            sketch_status.status).outerjoin(
+                sketch_status, sketch_status.parent_id == Sketch.id)
+        sketches = sketches.yield_per(500)
+
+        name_len, desc_len = db_session.query(
+            func.max(func.length(Sketch.name)),
+            func.max(func.length(Sketch.description))).one()
 
         if not name_len:
             name_len = 5
@@ -466,22 +491,23 @@ class ListSketches(Command):
         fmt_string = '{{0:^3d}} | {{1:{0:d}s}} | {{2:{1:d}s}}'.format(
             name_len, desc_len)
 
-        print('+-'*40)
-        print(' ID | Name {0:s} | Description'.format(' '*(name_len-5)))
-        print('+-'*40)
-        for sketch in sketches:
-            status = sketch.get_status.status
+        sys.stdout.write('+-'*40 + '\n')
+        sys.stdout.write(' ID | Name {0:s} | Description\n'.format(
+            ' '*(name_len-5)))
+        sys.stdout.write('+-'*40 + '\n')
+        for sketch_id, sketch_name, description, status in sketches:
             if status == 'deleted':
                 continue
 
             if status == 'archived':
-                name = '{0:s} (archived)'.format(sketch.name)
+                name = '{0:s} (archived)'.format(sketch_name)
             else:
-                name = sketch.name
+                name = sketch_name
 
-            print(fmt_string.format(
-                sketch.id, name, sketch.description))
-            print('-'*80)
+            sys.stdout.write(fmt_string.format(
+                sketch_id, name, description) + '\n')
+            sys.stdout.write('-'*80 + '\n')
+        sys.stdout.flush()
 
 
 class ImportTimeline(Command):
@@ -504,27 +530,34 @@ class ImportTimeline(Command):
             'docs/UploadData.md')
 
 
+# Commands registered with the shell manager, keyed by command name.
+_COMMANDS = {
+    'grant_user': GrantUser,
+    'add_user': AddUser,
+    'make_admin': MakeUserAdmin,
+    'list_users': ListUsers,
+    'add_group': AddGroup,
+    'list_groups': ListGroups,
+    'manage_group': GroupManager,
+    'add_index': AddSearchIndex,
+    'drop_db': DropDataBaseTables,
+    'list_sketches': ListSketches,
+    'purge': PurgeTimeline,
+    'search_template': SearchTemplateManager,
+    'import': ImportTimeline,
+    'version': GetVersion,
+    'disable_user': DisableUser,
+    'enable_user': EnableUser,
+}
+
+
 def main():
     """Main function of the script, setting up the shell manager."""
     # Setup Flask-script command manager and register commands.
     shell_manager = Manager(create_app)
-    shell_manager.add_command('grant_user', GrantUser())
-    shell_manager.add_command('add_user', AddUser())
-    shell_manager.add_command('make_admin', MakeUserAdmin())
-    shell_manager.add_command('list_users', ListUsers())
-    shell_manager.add_command('add_group', AddGroup())
-    shell_manager.add_command('list_groups', ListGroups)
-    shell_manager.add_command('manage_group', GroupManager())
-    shell_manager.add_command('add_index', AddSearchIndex())
+    for name, command_class in _COMMANDS.items():
+        shell_manager.add_command(name, command_class)
     shell_manager.add_command('db', MigrateCommand)
-    shell_manager.add_command('drop_db', DropDataBaseTables())
-    shell_manager.add_command('list_sketches', ListSketches())
-    shell_manager.add_command('purge', PurgeTimeline())
-    shell_manager.add_command('search_template', SearchTemplateManager())
-    shell_manager.add_command('import', ImportTimeline())
-    shell_manager.add_command('version', GetVersion())
-    shell_manager.add_command('disable_user', DisableUser())
-    shell_manager.add_command("enable_user", EnableUser())
     shell_manager.add_command('runserver',
                               Server(host='127.0.0.1', port=5000))
     shell_manager.add_option(